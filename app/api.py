@@ -1,12 +1,15 @@
 """FastAPI endpoints for RFM segmentation."""
 from fastapi import FastAPI, Depends, HTTPException, Query
-from fastapi.responses import StreamingResponse, HTMLResponse, Response
+from fastapi.responses import StreamingResponse, HTMLResponse, Response, ORJSONResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, text
-from typing import Optional, List
+from sqlalchemy import func, and_, select, bindparam
+from typing import Optional, List, Dict, Tuple
 from datetime import datetime
+from decimal import Decimal
 import csv
 import io
+import time
+import orjson
 from app.db import get_db, init_db
 from app import visualization
 from app.schemas import (
@@ -14,16 +17,84 @@ from app.schemas import (
     PipelineRunRequest,
     PipelineRunResponse,
     SegmentListResponse,
-    SegmentStats,
-    CustomerDetailResponse,
-    RFMFeatureResponse,
-    ClusterResponse
+    CustomerDetailResponse
 )
-from app.models import Customer, RFMFeature, CustomerCluster, Order
+from app.models import Customer, RFMFeature, CustomerCluster, ClusterCentroid, Order
 from app.pipeline.run_full import run_full_pipeline
-from app.config import settings
+from app.config import Settings, get_settings
 
-app = FastAPI(title="RFM Segmentation API", version="1.0.0")
+# Rows fetched per round-trip when streaming CSV exports
+EXPORT_BATCH_SIZE = 1000
+
+# The latest calc_date only changes when the pipeline runs; cache it briefly per process
+LATEST_CALC_DATE_TTL = 30.0
+_LATEST_CALC_CACHE = {"value": None, "fetched_at": 0.0}
+
+# Rendered dashboard HTML keyed by the latest calc_date as (fetched_at, html); only the
+# newest entry is kept. It expires like the latest calc_date, so pipeline runs in other
+# processes show up
+DASHBOARD_CACHE_TTL = 30.0
+_DASHBOARD_CACHE: Dict[datetime, Tuple[float, str]] = {}
+
+# Latest calc_date plus table totals as scalar subqueries: one statement, one round-trip
+TOTALS_STMT = select(
+    select(func.max(CustomerCluster.calc_date)).scalar_subquery(),
+    select(func.count(Customer.id)).scalar_subquery(),
+    select(func.count(Order.id)).scalar_subquery(),
+    select(func.count(CustomerCluster.id)).scalar_subquery()
+)
+
+# Per-segment statistics for one calc_date: a k-row lookup in cluster_centroids,
+# whose centroids are the exact per-cluster RFM means; built once so
+# SQLAlchemy's compiled-statement cache is hit on every request.
+SEGMENT_STATS_STMT = select(
+    ClusterCentroid.segment_name,
+    ClusterCentroid.cluster_id,
+    ClusterCentroid.customer_count,
+    ClusterCentroid.recency_days.label('avg_recency_days'),
+    ClusterCentroid.frequency.label('avg_frequency'),
+    ClusterCentroid.monetary.label('avg_monetary')
+).where(
+    ClusterCentroid.calc_date == bindparam('calc_date')
+).order_by(
+    ClusterCentroid.cluster_id
+)
+
+
+def orjson_default(obj):
+    """Serialize types orjson does not handle natively (Decimal from Numeric columns)."""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError
+
+
+class RFMJSONResponse(ORJSONResponse):
+    """ORJSONResponse that also serializes Decimal values."""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(
+            content,
+            default=orjson_default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        )
+
+
+app = FastAPI(title="RFM Segmentation API", version="1.0.0", default_response_class=RFMJSONResponse)
+
+
+def latest_calc_date(db: Session) -> Optional[datetime]:
+    """Return the latest cluster calc_date, cached for LATEST_CALC_DATE_TTL seconds."""
+    now = time.monotonic()
+    if _LATEST_CALC_CACHE["value"] is not None and now - _LATEST_CALC_CACHE["fetched_at"] < LATEST_CALC_DATE_TTL:
+        return _LATEST_CALC_CACHE["value"]
+    value = db.query(func.max(CustomerCluster.calc_date)).scalar()
+    _LATEST_CALC_CACHE.update(value=value, fetched_at=now)
+    return value
+
+
+def invalidate_latest_calc_date():
+    """Force the next latest_calc_date() call to hit the database."""
+    _LATEST_CALC_CACHE["fetched_at"] = 0.0
 
 
 @app.on_event("startup")
@@ -32,38 +103,35 @@ async def startup_event():
     init_db()
 
 
-@app.get("/health", response_model=HealthResponse)
+@app.get("/health", responses={200: {"model": HealthResponse}})
 async def health_check(db: Session = Depends(get_db)):
     """Health check endpoint met basisstatistieken."""
+    # Basisstatistieken in één round-trip; die query test meteen de databaseverbinding
+    # (best-effort; bij fouten vallen we terug op None)
     try:
-        # Test database connection
-        db.execute(text("SELECT 1"))
+        latest_calc, total_customers, total_orders, total_clusters = db.execute(TOTALS_STMT).one()
         db_status = "connected"
     except Exception as e:
         db_status = f"error: {str(e)}"
-
-    # Basisstatistieken (best-effort; bij fouten vallen we terug op None)
-    latest_calc_date = db.query(func.max(CustomerCluster.calc_date)).scalar()
-    total_customers = db.query(func.count(Customer.id)).scalar()
-    total_orders = db.query(func.count(Order.id)).scalar()
-    total_clusters = db.query(func.count(CustomerCluster.id)).scalar()
+        latest_calc = total_customers = total_orders = total_clusters = None
     
     # HealthResponse is bewust minimaal gehouden (status + database);
     # we geven extra info terug als losse velden in de JSON-respons.
-    base = HealthResponse(status="ok", database=db_status)
-    return {
-        **base.model_dump(),
-        "latest_calc_date": latest_calc_date,
+    return RFMJSONResponse(content={
+        "status": "ok",
+        "database": db_status,
+        "latest_calc_date": latest_calc,
         "total_customers": total_customers,
         "total_orders": total_orders,
         "total_clusters": total_clusters,
-    }
+    })
 
 
 @app.post("/pipeline/run", response_model=PipelineRunResponse)
 async def run_pipeline(
     request: Optional[PipelineRunRequest] = None,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    settings: Settings = Depends(get_settings)
 ):
     """Trigger the full RFM + clustering pipeline."""
     if request is None:
@@ -75,6 +143,8 @@ async def run_pipeline(
     
     # Run pipeline
     results = run_full_pipeline(calc_date=calc_date, window_days=window_days, k=k)
+    _DASHBOARD_CACHE.clear()
+    invalidate_latest_calc_date()
     
     if results['status'] == 'error':
         raise HTTPException(status_code=500, detail=f"Pipeline failed: {results.get('errors', [])}")
@@ -93,7 +163,7 @@ async def run_pipeline(
     )
 
 
-@app.get("/segments", response_model=SegmentListResponse)
+@app.get("/segments", responses={200: {"model": SegmentListResponse}})
 async def get_segments(
     calc_date: Optional[datetime] = Query(None, description="Calculation date. If not provided, uses latest."),
     db: Session = Depends(get_db)
@@ -101,67 +171,45 @@ async def get_segments(
     """Get list of all segments with statistics."""
     # If calc_date not provided, get the latest one
     if calc_date is None:
-        latest_calc = db.query(func.max(CustomerCluster.calc_date)).scalar()
+        latest_calc = latest_calc_date(db)
         if latest_calc is None:
             raise HTTPException(status_code=404, detail="No segments found. Run pipeline first.")
         calc_date = latest_calc
     
-    # Get segment statistics
-    segment_stats = db.query(
-        CustomerCluster.segment_name,
-        CustomerCluster.cluster_id,
-        func.count(CustomerCluster.customer_id).label('customer_count'),
-        func.avg(RFMFeature.recency_days).label('avg_recency_days'),
-        func.avg(RFMFeature.frequency).label('avg_frequency'),
-        func.avg(RFMFeature.monetary).label('avg_monetary')
-    ).join(
-        RFMFeature,
-        and_(
-            CustomerCluster.customer_id == RFMFeature.customer_id,
-            CustomerCluster.calc_date == RFMFeature.calc_date
-        )
-    ).filter(
-        CustomerCluster.calc_date == calc_date
-    ).group_by(
-        CustomerCluster.segment_name,
-        CustomerCluster.cluster_id
-    ).all()
+    # Get segment statistics: k rows, so a plain buffered fetch (yield_per would open a server-side cursor)
+    rows = db.execute(SEGMENT_STATS_STMT, {"calc_date": calc_date}).mappings().all()
+    segments = [dict(row) for row in rows]
     
-    segments = [
-        SegmentStats(
-            segment_name=stat.segment_name,
-            cluster_id=stat.cluster_id,
-            customer_count=stat.customer_count,
-            avg_recency_days=float(stat.avg_recency_days or 0),
-            avg_frequency=float(stat.avg_frequency or 0),
-            avg_monetary=float(stat.avg_monetary or 0)
-        )
-        for stat in segment_stats
-    ]
-    
-    return SegmentListResponse(calc_date=calc_date, segments=segments)
+    return RFMJSONResponse(content={'calc_date': calc_date, 'segments': segments})
 
 
 @app.get("/segments/{segment_name}/customers")
 async def get_segment_customers(
     segment_name: str,
     calc_date: Optional[datetime] = Query(None, description="Calculation date. If not provided, uses latest."),
-    page: int = Query(1, ge=1),
+    after: Optional[str] = Query(None, description="Cursor: return customers with customer_id after this value."),
     page_size: int = Query(100, ge=1, le=1000),
     db: Session = Depends(get_db)
 ):
-    """Get paginated list of customers in a segment."""
+    """Get a keyset-paginated list of customers in a segment, ordered by customer_id."""
     # If calc_date not provided, get the latest one
     if calc_date is None:
-        latest_calc = db.query(func.max(CustomerCluster.calc_date)).scalar()
+        latest_calc = latest_calc_date(db)
         if latest_calc is None:
             raise HTTPException(status_code=404, detail="No segments found. Run pipeline first.")
         calc_date = latest_calc
     
     # Get customers in segment
-    offset = (page - 1) * page_size
-    
-    customers = db.query(Customer, RFMFeature, CustomerCluster).join(
+    stmt = select(
+        Customer.customer_id,
+        Customer.email,
+        Customer.country,
+        RFMFeature.recency_days,
+        RFMFeature.frequency,
+        RFMFeature.monetary,
+        CustomerCluster.segment_name,
+        CustomerCluster.cluster_id
+    ).join(
         CustomerCluster,
         and_(
             Customer.customer_id == CustomerCluster.customer_id,
@@ -174,31 +222,27 @@ async def get_segment_customers(
             Customer.customer_id == RFMFeature.customer_id,
             RFMFeature.calc_date == calc_date
         )
-    ).offset(offset).limit(page_size).all()
+    )
+    if after:
+        stmt = stmt.where(Customer.customer_id > after)
+    # At most page_size rows: a plain buffered fetch, no server-side cursor
+    rows = db.execute(stmt.order_by(Customer.customer_id).limit(page_size)).mappings().all()
     
-    results = []
-    for customer, rfm, cluster in customers:
-        results.append({
-            'customer_id': customer.customer_id,
-            'email': customer.email,
-            'country': customer.country,
-            'recency_days': rfm.recency_days,
-            'frequency': rfm.frequency,
-            'monetary': float(rfm.monetary),
-            'segment_name': cluster.segment_name,
-            'cluster_id': cluster.cluster_id
-        })
+    # Decimal monetary values are serialized as floats by RFMJSONResponse
+    results = [dict(row) for row in rows]
+    next_cursor = results[-1]['customer_id'] if len(results) == page_size else None
     
-    return {
+    return RFMJSONResponse(content={
         'segment_name': segment_name,
         'calc_date': calc_date,
-        'page': page,
+        'after': after,
         'page_size': page_size,
+        'next_cursor': next_cursor,
         'customers': results
-    }
+    })
 
 
-@app.get("/customers/{customer_id}", response_model=CustomerDetailResponse)
+@app.get("/customers/{customer_id}", responses={200: {"model": CustomerDetailResponse}})
 async def get_customer(
     customer_id: str,
     calc_date: Optional[datetime] = Query(None, description="Calculation date. If not provided, uses latest."),
@@ -215,13 +259,13 @@ async def get_customer(
             RFMFeature.customer_id == customer_id
         ).scalar()
         if latest_calc is None:
-            return CustomerDetailResponse(
-                customer_id=customer.customer_id,
-                email=customer.email,
-                country=customer.country,
-                rfm=None,
-                segment=None
-            )
+            return RFMJSONResponse(content={
+                'customer_id': customer.customer_id,
+                'email': customer.email,
+                'country': customer.country,
+                'rfm': None,
+                'segment': None
+            })
         calc_date = latest_calc
     
     # Get RFM features
@@ -232,24 +276,52 @@ async def get_customer(
         )
     ).first()
     
-    # Get cluster assignment
-    cluster = db.query(CustomerCluster).filter(
+    # Get cluster assignment together with its shared centroid
+    cluster, centroid = db.query(CustomerCluster, ClusterCentroid).outerjoin(
+        ClusterCentroid,
+        and_(
+            CustomerCluster.calc_date == ClusterCentroid.calc_date,
+            CustomerCluster.cluster_id == ClusterCentroid.cluster_id
+        )
+    ).filter(
         and_(
             CustomerCluster.customer_id == customer_id,
             CustomerCluster.calc_date == calc_date
         )
-    ).first()
+    ).first() or (None, None)
     
-    rfm_response = RFMFeatureResponse.model_validate(rfm_feature) if rfm_feature else None
-    cluster_response = ClusterResponse.model_validate(cluster) if cluster else None
+    rfm_response = {
+        'customer_id': rfm_feature.customer_id,
+        'calc_date': rfm_feature.calc_date,
+        'recency_days': rfm_feature.recency_days,
+        'frequency': rfm_feature.frequency,
+        'monetary': rfm_feature.monetary
+    } if rfm_feature else None
+    # cluster_score keeps its JSON-string shape; rows written before centroids
+    # were stored separately still carry their own copy
+    if centroid is not None:
+        cluster_score = orjson.dumps({
+            'recency_days': centroid.recency_days,
+            'frequency': centroid.frequency,
+            'monetary': centroid.monetary
+        }).decode()
+    else:
+        cluster_score = cluster.cluster_score if cluster else None
+    cluster_response = {
+        'customer_id': cluster.customer_id,
+        'calc_date': cluster.calc_date,
+        'cluster_id': cluster.cluster_id,
+        'segment_name': cluster.segment_name,
+        'cluster_score': cluster_score
+    } if cluster else None
     
-    return CustomerDetailResponse(
-        customer_id=customer.customer_id,
-        email=customer.email,
-        country=customer.country,
-        rfm=rfm_response,
-        segment=cluster_response
-    )
+    return RFMJSONResponse(content={
+        'customer_id': customer.customer_id,
+        'email': customer.email,
+        'country': customer.country,
+        'rfm': rfm_response,
+        'segment': cluster_response
+    })
 
 
 @app.get("/export/segments/{segment_name}")
@@ -261,44 +333,46 @@ async def export_segment(
     """Export segment customers as CSV."""
     # If calc_date not provided, get the latest one
     if calc_date is None:
-        latest_calc = db.query(func.max(CustomerCluster.calc_date)).scalar()
+        latest_calc = latest_calc_date(db)
         if latest_calc is None:
             raise HTTPException(status_code=404, detail="No segments found. Run pipeline first.")
         calc_date = latest_calc
     
-    # Get all customers in segment
-    customers = db.query(Customer, CustomerCluster).join(
-        CustomerCluster,
-        and_(
-            Customer.customer_id == CustomerCluster.customer_id,
-            CustomerCluster.calc_date == calc_date,
-            CustomerCluster.segment_name == segment_name
-        )
-    ).all()
-    
-    if not customers:
+    segment_filter = and_(
+        CustomerCluster.calc_date == calc_date,
+        CustomerCluster.segment_name == segment_name
+    )
+    if db.query(CustomerCluster.id).filter(segment_filter).first() is None:
         raise HTTPException(status_code=404, detail=f"No customers found in segment '{segment_name}'")
     
-    # Create CSV in memory
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Write header
-    writer.writerow(['customer_id', 'email', 'country', 'segment_name'])
-    
-    # Write data
-    for customer, cluster in customers:
-        writer.writerow([
-            customer.customer_id,
-            customer.email or '',
-            customer.country or '',
-            cluster.segment_name
-        ])
+    # Stream customers in segment via a server-side cursor
+    stmt = select(
+        Customer.customer_id,
+        Customer.email,
+        Customer.country,
+        CustomerCluster.segment_name
+    ).join(
+        CustomerCluster,
+        and_(Customer.customer_id == CustomerCluster.customer_id, segment_filter)
+    ).execution_options(yield_per=EXPORT_BATCH_SIZE)
     
-    output.seek(0)
+    def generate_csv():
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(['customer_id', 'email', 'country', 'segment_name'])
+        yield output.getvalue()
+        
+        for partition in db.execute(stmt).partitions():
+            output.seek(0)
+            output.truncate()
+            writer.writerows(
+                (customer_id, email or '', country or '', seg)
+                for customer_id, email, country, seg in partition
+            )
+            yield output.getvalue()
     
     return StreamingResponse(
-        iter([output.getvalue()]),
+        generate_csv(),
         media_type="text/csv",
         headers={
             "Content-Disposition": f"attachment; filename=segment_{segment_name}_{calc_date.date()}.csv"
@@ -306,54 +380,8 @@ async def export_segment(
     )
 
 
-@app.get("/dashboard")
-async def dashboard(db: Session = Depends(get_db)):
-    """Eenvoudig HTML-dashboard met kernstatistieken en segmentoverzicht."""
-    # Get latest calc_date
-    latest_calc = db.query(func.max(CustomerCluster.calc_date)).scalar()
-    total_customers = db.query(func.count(Customer.id)).scalar()
-    total_orders = db.query(func.count(Order.id)).scalar()
-    total_clusters = db.query(func.count(CustomerCluster.id)).scalar()
-
-    if latest_calc is None:
-        html = """
-        <!DOCTYPE html>
-        <html>
-        <head><title>RFM Segmentation Dashboard</title></head>
-        <body>
-            <h1>RFM Segmentation Dashboard</h1>
-            <p>No segments found. Please run the pipeline first.</p>
-            <p><strong>Total customers:</strong> %d</p>
-            <p><strong>Total orders:</strong> %d</p>
-            <p><a href="/docs">API Documentation</a></p>
-        </body>
-        </html>
-        """ % (total_customers or 0, total_orders or 0)
-        return HTMLResponse(content=html)
-    
-    # Get segment statistics
-    segment_stats = db.query(
-        CustomerCluster.segment_name,
-        CustomerCluster.cluster_id,
-        func.count(CustomerCluster.customer_id).label('customer_count'),
-        func.avg(RFMFeature.recency_days).label('avg_recency_days'),
-        func.avg(RFMFeature.frequency).label('avg_frequency'),
-        func.avg(RFMFeature.monetary).label('avg_monetary')
-    ).join(
-        RFMFeature,
-        and_(
-            CustomerCluster.customer_id == RFMFeature.customer_id,
-            CustomerCluster.calc_date == RFMFeature.calc_date
-        )
-    ).filter(
-        CustomerCluster.calc_date == latest_calc
-    ).group_by(
-        CustomerCluster.segment_name,
-        CustomerCluster.cluster_id
-    ).all()
-    
-    # Generate HTML
-    html = f"""
+# Dashboard page fragments; rows are joined in between header and footer
+DASHBOARD_HEADER = """
     <!DOCTYPE html>
     <html>
     <head>
@@ -371,11 +399,11 @@ async def dashboard(db: Session = Depends(get_db)):
     <body>
         <h1>RFM Segmentation Dashboard</h1>
         <div class="stats">
-            <p><strong>Calculation Date:</strong> {latest_calc.strftime('%Y-%m-%d %H:%M:%S')}</p>
+            <p><strong>Calculation Date:</strong> {calc_date}</p>
             <p>
-                <strong>Total customers:</strong> {total_customers or 0} |
-                <strong>Total orders:</strong> {total_orders or 0} |
-                <strong>Total cluster assignments:</strong> {total_clusters or 0}
+                <strong>Total customers:</strong> {total_customers} |
+                <strong>Total orders:</strong> {total_orders} |
+                <strong>Total cluster assignments:</strong> {total_clusters}
             </p>
             <p>
                 <a href="/docs">API Documentation</a> | 
@@ -424,25 +452,73 @@ async def dashboard(db: Session = Depends(get_db)):
             </thead>
             <tbody>
     """
-    
-    for stat in segment_stats:
-        html += f"""
+
+DASHBOARD_ROW = """
                 <tr>
-                    <td>{stat.segment_name}</td>
-                    <td>{stat.cluster_id}</td>
-                    <td>{stat.customer_count}</td>
-                    <td>{stat.avg_recency_days:.1f}</td>
-                    <td>{stat.avg_frequency:.1f}</td>
-                    <td>{stat.avg_monetary:.2f}</td>
+                    <td>{segment_name}</td>
+                    <td>{cluster_id}</td>
+                    <td>{customer_count}</td>
+                    <td>{avg_recency_days:.1f}</td>
+                    <td>{avg_frequency:.1f}</td>
+                    <td>{avg_monetary:.2f}</td>
                 </tr>
         """
-    
-    html += """
+
+DASHBOARD_FOOTER = """
             </tbody>
         </table>
     </body>
     </html>
     """
+
+
+@app.get("/dashboard")
+async def dashboard(db: Session = Depends(get_db)):
+    """Eenvoudig HTML-dashboard met kernstatistieken en segmentoverzicht."""
+    # Serve the cached page while it is fresh and no newer pipeline run exists
+    latest_calc = latest_calc_date(db)
+    cached = _DASHBOARD_CACHE.get(latest_calc)
+    if cached is not None and time.monotonic() - cached[0] < DASHBOARD_CACHE_TTL:
+        return HTMLResponse(content=cached[1])
+    
+    # Get latest calc_date and totals in one round-trip
+    latest_calc, total_customers, total_orders, total_clusters = db.execute(TOTALS_STMT).one()
+
+    if latest_calc is None:
+        html = """
+        <!DOCTYPE html>
+        <html>
+        <head><title>RFM Segmentation Dashboard</title></head>
+        <body>
+            <h1>RFM Segmentation Dashboard</h1>
+            <p>No segments found. Please run the pipeline first.</p>
+            <p><strong>Total customers:</strong> %d</p>
+            <p><strong>Total orders:</strong> %d</p>
+            <p><a href="/docs">API Documentation</a></p>
+        </body>
+        </html>
+        """ % (total_customers or 0, total_orders or 0)
+        return HTMLResponse(content=html)
+    
+    # Get segment statistics
+    segment_stats = db.execute(SEGMENT_STATS_STMT, {"calc_date": latest_calc}).mappings().all()
+    
+    # Generate HTML
+    html = "".join([
+        DASHBOARD_HEADER.format(
+            calc_date=latest_calc.strftime('%Y-%m-%d %H:%M:%S'),
+            total_customers=total_customers or 0,
+            total_orders=total_orders or 0,
+            total_clusters=total_clusters or 0
+        ),
+        *[DASHBOARD_ROW.format(**stat) for stat in segment_stats],
+        DASHBOARD_FOOTER
+    ])
+    
+    # Don't cache a page without segment rows (centroids not written yet)
+    if segment_stats:
+        _DASHBOARD_CACHE.clear()
+        _DASHBOARD_CACHE[latest_calc] = (time.monotonic(), html)
     
     return HTMLResponse(content=html)
 
@@ -454,7 +530,7 @@ async def get_plot(
     db: Session = Depends(get_db)
 ):
     """Get a matplotlib PNG plot of customers in clusters."""
-    plot_buffer = visualization.create_matplotlib_plot(db, calc_date, plot_type)
+    plot_buffer = visualization.create_matplotlib_plot(db, calc_date or latest_calc_date(db), plot_type)
     return Response(
         content=plot_buffer.read(),
         media_type="image/png",
@@ -471,7 +547,7 @@ async def get_interactive_plot(
     db: Session = Depends(get_db)
 ):
     """Get an interactive Plotly HTML plot of customers in clusters."""
-    html_content = visualization.create_plotly_plot(db, calc_date, plot_type)
+    html_content = visualization.create_plotly_plot(db, calc_date or latest_calc_date(db), plot_type)
     return HTMLResponse(content=html_content)
 
 
@@ -481,6 +557,6 @@ async def get_3d_plot(
     db: Session = Depends(get_db)
 ):
     """Get an interactive 3D Plotly plot showing all RFM dimensions."""
-    html_content = visualization.create_3d_plotly_plot(db, calc_date)
+    html_content = visualization.create_3d_plotly_plot(db, calc_date or latest_calc_date(db))
     return HTMLResponse(content=html_content)
 
@@ -1,12 +1,16 @@
 """K-means clustering logic for RFM features."""
+from itertools import islice
 import numpy as np
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sqlalchemy import and_, func, insert, select
 from sqlalchemy.orm import Session
 from typing import List, Tuple, Dict
-from app.models import RFMFeature, CustomerCluster
+from app.models import RFMFeature, CustomerCluster, ClusterCentroid
 from datetime import datetime
 
+# Above this many customers, switch from full-batch KMeans to MiniBatchKMeans
+MINIBATCH_THRESHOLD = 50_000
+
 
 def map_cluster_to_segment(
     cluster_id: int,
@@ -68,12 +72,34 @@ def map_cluster_to_segment(
         return "Need Attention"
 
 
+def standardize_inplace(X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Standardize feature columns of X in place (zero mean, unit variance).
+    
+    Replaces sklearn's StandardScaler without its validation and copies.
+    Constant features are only centred.
+    
+    Args:
+        X: Float feature matrix of shape (n_samples, n_features), modified in place
+    
+    Returns:
+        Tuple of (column means, column standard deviations) as float64 arrays;
+        original values are recovered with X * sd + mu
+    """
+    mu = X.mean(axis=0, dtype=np.float64)
+    sd = X.std(axis=0, dtype=np.float64)
+    sd[sd == 0] = 1.0
+    np.subtract(X, mu, out=X)
+    np.divide(X, sd, out=X)
+    return mu, sd
+
+
 def run_kmeans_clustering(
     db: Session,
     calc_date: datetime,
     k: int = 5,
     random_state: int = 42
-) -> Tuple[List[CustomerCluster], np.ndarray]:
+) -> Tuple[List[Dict], List[Dict], np.ndarray]:
     """
     Run K-means clustering on RFM features.
     
@@ -84,60 +110,153 @@ def run_kmeans_clustering(
         random_state: Random state for reproducibility
     
     Returns:
-        Tuple of (list of CustomerCluster objects, cluster centroids array)
+        Tuple of (list of CustomerCluster mappings, list of ClusterCentroid
+        mappings, cluster centroids array)
     """
-    # Get RFM features for the calculation date
-    rfm_features = db.query(RFMFeature).filter(
+    # Get RFM features for the calculation date (columns only, no ORM objects)
+    n_customers = db.query(func.count(RFMFeature.id)).filter(
         RFMFeature.calc_date == calc_date
-    ).all()
+    ).scalar()
+    
+    if n_customers < k:
+        raise ValueError(f"Not enough customers ({n_customers}) for {k} clusters")
     
-    if len(rfm_features) < k:
-        raise ValueError(f"Not enough customers ({len(rfm_features)}) for {k} clusters")
+    stmt = select(
+        RFMFeature.customer_id,
+        RFMFeature.recency_days,
+        RFMFeature.frequency,
+        RFMFeature.monetary
+    ).where(
+        RFMFeature.calc_date == calc_date
+    ).execution_options(yield_per=4096)
     
-    # Extract features as numpy array
+    # Extract features as numpy array (kept in float64 for the persisted centroids)
     # Features: [recency_days, frequency, monetary]
-    X = np.array([
-        [rfm.recency_days, rfm.frequency, float(rfm.monetary)]
-        for rfm in rfm_features
-    ])
+    features = np.empty((n_customers, 3), dtype=np.float64)
+    customer_ids = []
+    rows = db.execute(stmt)
+    for i, (customer_id, recency_days, frequency, monetary) in enumerate(islice(rows, n_customers)):
+        features[i] = (recency_days, frequency, monetary)
+        customer_ids.append(customer_id)
+    
+    # The COUNT and the scan are separate statements; a concurrent pipeline run
+    # can commit in between, and then features would be overrun or partly uninitialised
+    if len(customer_ids) != n_customers or rows.fetchone() is not None:
+        rows.close()
+        raise ValueError(
+            f"RFM features for {calc_date} changed while loading "
+            f"(counted {n_customers}); re-run the clustering"
+        )
     
-    # Standardize features
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
+    # float32 is precise enough for clustering; standardize that copy in place
+    X = features.astype(np.float32)
+    standardize_inplace(X)
     
-    # Run K-means
-    kmeans = KMeans(n_clusters=k, random_state=random_state, n_init=10)
-    cluster_labels = kmeans.fit_predict(X_scaled)
+    # Run K-means directly on the standardized array
+    if len(X) > MINIBATCH_THRESHOLD:
+        kmeans = MiniBatchKMeans(
+            n_clusters=k, random_state=random_state, batch_size=4096, n_init=3
+        )
+    else:
+        kmeans = KMeans(
+            n_clusters=k, random_state=random_state, n_init=1,
+            init="k-means++", algorithm="elkan", copy_x=False
+        )
+    cluster_labels = kmeans.fit_predict(X)
     
     # Get centroids (in standardized space)
     centroids_std = kmeans.cluster_centers_
     
-    # Transform centroids back to original space for interpretation
-    centroids_original = scaler.inverse_transform(centroids_std)
-    
-    # Create cluster assignments
-    cluster_assignments = []
-    for i, rfm in enumerate(rfm_features):
-        cluster_id = int(cluster_labels[i])
-        segment_name = map_cluster_to_segment(cluster_id, centroids_std)
-        
-        # Store centroid info as JSON string (optional)
-        import json
-        centroid_info = {
-            'recency_days': float(centroids_original[cluster_id][0]),
-            'frequency': float(centroids_original[cluster_id][1]),
-            'monetary': float(centroids_original[cluster_id][2])
+    # Centroids in original space as exact float64 per-cluster means of the
+    # original rows (back-transforming the float32 centers adds rounding noise)
+    cluster_sizes = np.bincount(cluster_labels, minlength=k)
+    centroids_original = np.column_stack([
+        np.bincount(cluster_labels, weights=features[:, j], minlength=k)
+        for j in range(features.shape[1])
+    ]) / np.maximum(cluster_sizes, 1)[:, None]
+    
+    # Segment name only depends on the cluster, so compute it once per cluster
+    segment_by_cluster = [map_cluster_to_segment(cid, centroids_std) for cid in range(k)]
+    
+    # One centroid row per cluster; assignments reference it via (calc_date, cluster_id)
+    cluster_centroids = [
+        {
+            'calc_date': calc_date,
+            'cluster_id': cid,
+            'segment_name': segment_by_cluster[cid],
+            'customer_count': int(cluster_sizes[cid]),
+            'recency_days': float(centroids_original[cid][0]),
+            'frequency': float(centroids_original[cid][1]),
+            'monetary': float(centroids_original[cid][2])
         }
-        cluster_score = json.dumps(centroid_info)
-        
-        cluster_assignment = CustomerCluster(
-            customer_id=rfm.customer_id,
-            calc_date=calc_date,
-            cluster_id=cluster_id,
-            segment_name=segment_name,
-            cluster_score=cluster_score
-        )
-        cluster_assignments.append(cluster_assignment)
+        for cid in range(k)
+    ]
+    
+    # Create cluster assignments as plain mappings for bulk insertion
+    cluster_assignments = [
+        {
+            'customer_id': customer_id,
+            'calc_date': calc_date,
+            'cluster_id': label,
+            'segment_name': segment_by_cluster[label]
+        }
+        for customer_id, label in zip(customer_ids, cluster_labels.tolist())
+    ]
     
-    return cluster_assignments, centroids_original
+    return cluster_assignments, cluster_centroids, centroids_original
 
+
+def backfill_cluster_centroids(db: Session) -> List[datetime]:
+    """
+    Write cluster_centroids rows for calc_dates clustered before they were stored.
+    
+    Older runs only have customer_clusters rows, which leaves /segments and
+    /dashboard empty for them. Their centroids (the per-cluster RFM means) are
+    recomputed from customer_clusters joined to rfm_features.
+    
+    Args:
+        db: Database session; the caller commits
+    
+    Returns:
+        The calc_dates that were backfilled
+    """
+    has_centroids = select(ClusterCentroid.id).where(
+        ClusterCentroid.calc_date == CustomerCluster.calc_date
+    ).exists()
+    missing = db.execute(
+        select(CustomerCluster.calc_date).where(~has_centroids).group_by(CustomerCluster.calc_date)
+    ).scalars().all()
+    
+    for calc_date in missing:
+        summary = select(
+            CustomerCluster.calc_date,
+            CustomerCluster.cluster_id,
+            CustomerCluster.segment_name,
+            func.count(CustomerCluster.customer_id),
+            func.avg(RFMFeature.recency_days),
+            func.avg(RFMFeature.frequency),
+            func.avg(RFMFeature.monetary)
+        ).join(
+            RFMFeature,
+            and_(
+                CustomerCluster.customer_id == RFMFeature.customer_id,
+                CustomerCluster.calc_date == RFMFeature.calc_date
+            )
+        ).where(
+            CustomerCluster.calc_date == calc_date
+        ).group_by(
+            CustomerCluster.calc_date,
+            CustomerCluster.cluster_id,
+            CustomerCluster.segment_name
+        )
+        db.execute(
+            insert(ClusterCentroid).from_select(
+                [
+                    'calc_date', 'cluster_id', 'segment_name', 'customer_count',
+                    'recency_days', 'frequency', 'monetary'
+                ],
+                summary
+            )
+        )
+    
+    return missing
@@ -1,6 +1,7 @@
 """Configuration management using environment variables."""
 from pydantic_settings import BaseSettings
 from typing import Optional
+from functools import lru_cache
 import os
 
 
@@ -35,6 +36,12 @@ class Settings(BaseSettings):
         case_sensitive = True
 
 
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Return the process-wide Settings instance (read from the environment once)."""
+    return Settings()
+
+
 # Global settings instance
-settings = Settings()
+settings = get_settings()
 
@@ -7,6 +7,11 @@ from app.config import settings
 engine = create_engine(
     settings.database_url,
     pool_pre_ping=True,
+    # Batch executemany() for bulk writes: multi-row VALUES for INSERTs,
+    # psycopg2's execute_batch for UPDATE/DELETE
+    executemany_mode="values_plus_batch",
+    insertmanyvalues_page_size=1000,
+    executemany_batch_page_size=500,
     echo=False  # Set to True for SQL query logging
 )
 
@@ -27,6 +32,15 @@ def get_db():
 
 
 def init_db():
-    """Initialize database tables."""
+    """Initialize database tables and backfill centroids missing for older runs."""
     Base.metadata.create_all(bind=engine)
+    
+    # Imported here: app.models imports Base from this module
+    from app.clustering import backfill_cluster_centroids
+    db = SessionLocal()
+    try:
+        backfill_cluster_centroids(db)
+        db.commit()
+    finally:
+        db.close()
 
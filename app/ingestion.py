@@ -1,16 +1,43 @@
 """Data ingestion logic for CSV files."""
 import pandas as pd
+import io
 import os
 from pathlib import Path
+from sqlalchemy import column, func, select, table as sa_table
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
 from datetime import datetime
-from typing import Optional
+from typing import Optional, List
 from app.models import Customer, Order
 from app.config import settings
 
+# Rows per pd.read_csv chunk; memory use is bounded by this instead of the file size
+INGEST_CHUNK_SIZE = 50_000
+
+# Keys per IN (...) lookup in the upsert fallback; old SQLite allows at most 999 bound parameters
+FALLBACK_KEY_BATCH_SIZE = 500
+
+# Known CSV columns and their dtypes; other columns are not read.
+# IDs stay strings (no int inference), repeated codes are stored as categories.
+CUSTOMER_CSV_DTYPES = {
+    'customer_id': 'string',
+    'email': 'string',
+    'country': 'category',
+    'created_at': 'string',
+}
+ORDER_CSV_DTYPES = {
+    'order_id': 'string',
+    'customer_id': 'string',
+    'order_date': 'string',
+    'order_amount': 'float64',
+    'currency': 'category',
+    'status': 'category',
+}
+
 
 def parse_date(date_str: Optional[str]) -> Optional[datetime]:
-    """Parse date string to datetime object."""
+    """Parse a single date string to datetime object (see parse_date_column for whole columns)."""
     if pd.isna(date_str) or date_str is None or date_str == '':
         return None
     
@@ -28,6 +55,190 @@ def parse_date(date_str: Optional[str]) -> Optional[datetime]:
         return None
 
 
+def parse_date_column(values: pd.Series) -> pd.Series:
+    """
+    Parse a column of date strings to datetimes in one vectorized pass.
+    
+    ISO dates (with or without time) take the exact-format fast path; the
+    remaining values are parsed day-first like parse_date. Unparseable or
+    empty values become NaT.
+    """
+    text = values.astype('string').str.strip()
+    parsed = pd.to_datetime(text, format='ISO8601', errors='coerce')
+    rest = parsed.isna() & text.notna() & (text != '')
+    if rest.any():
+        parsed[rest] = pd.to_datetime(text[rest], format='mixed', dayfirst=True, errors='coerce')
+    return parsed
+
+
+def _clean_str(series: pd.Series) -> pd.Series:
+    """Strip string values in a column; missing values become None."""
+    return series.astype(str).str.strip().where(series.notna(), None)
+
+
+def _to_records(df: pd.DataFrame) -> List[dict]:
+    """Convert a DataFrame to row dicts with None for missing values."""
+    return df.astype(object).where(df.notna(), None).to_dict(orient='records')
+
+
+def _insert_for(db: Session):
+    """
+    Return the dialect-specific insert() that supports ON CONFLICT upserts,
+    or None when the database has no ON CONFLICT (e.g. SQLite < 3.24).
+    """
+    dialect = db.get_bind().dialect
+    if dialect.name == 'postgresql':
+        return pg_insert
+    if dialect.name == 'sqlite' and dialect.dbapi.sqlite_version_info >= (3, 24):
+        return sqlite_insert
+    return None
+
+
+def _copy_to_staging(db: Session, table, frame: pd.DataFrame):
+    """
+    COPY a cleaned chunk into a temporary staging table (PostgreSQL only).
+    
+    The staging table has only the chunk's columns and is dropped on commit.
+    """
+    staging = f"{table.name}_staging"
+    columns = ', '.join(frame.columns)
+    conn = db.connection()
+    conn.exec_driver_sql(f"DROP TABLE IF EXISTS pg_temp.{staging}")
+    conn.exec_driver_sql(
+        f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS "
+        f"SELECT {columns} FROM {table.name} WITH NO DATA"
+    )
+    
+    buffer = io.StringIO()
+    frame.to_csv(buffer, index=False, header=False, na_rep='\\N')
+    buffer.seek(0)
+    with conn.connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {staging} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+            buffer
+        )
+    return sa_table(staging, *(column(col) for col in frame.columns))
+
+
+def _upsert_source(db: Session, insert, table, frame: pd.DataFrame):
+    """
+    Build the INSERT for a cleaned chunk and its executemany parameters.
+    
+    On PostgreSQL the chunk goes through COPY into a staging table and is
+    inserted with INSERT ... SELECT (no parameters); elsewhere the rows are
+    passed as executemany parameters.
+    """
+    if db.get_bind().dialect.name == 'postgresql':
+        staging = _copy_to_staging(db, table, frame)
+        return insert(table).from_select(list(frame.columns), select(staging)), None
+    return insert(table), _to_records(frame)
+
+
+def _upsert_fallback(db: Session, model, key: str, frame: pd.DataFrame, keep_existing=()) -> None:
+    """
+    Upsert without ON CONFLICT: look up which of the chunk's keys exist
+    (batched IN queries), then one bulk insert and one bulk update instead
+    of a lookup per row.
+    
+    Columns in keep_existing are not overwritten with None.
+    """
+    key_col = getattr(model, key)
+    keys = frame[key].tolist()
+    existing_ids = {}
+    for start in range(0, len(keys), FALLBACK_KEY_BATCH_SIZE):
+        batch = keys[start:start + FALLBACK_KEY_BATCH_SIZE]
+        existing_ids.update(db.query(key_col, model.id).filter(key_col.in_(batch)).all())
+    row_ids = frame[key].map(existing_ids)
+    is_new = row_ids.isna().to_numpy()
+    
+    inserts = _to_records(frame[is_new])
+    updates = _to_records(frame[~is_new].assign(id=row_ids[~is_new].astype('int64')))
+    if keep_existing:
+        updates = [
+            {col: value for col, value in update.items() if value is not None or col not in keep_existing}
+            for update in updates
+        ]
+    
+    if inserts:
+        db.bulk_insert_mappings(model, inserts)
+    if updates:
+        db.bulk_update_mappings(model, updates)
+
+
+def _upsert_customers(db: Session, df: pd.DataFrame) -> None:
+    """Upsert one chunk of the customers CSV with a single statement."""
+    # Clean whole columns at once; the last row wins for duplicate customer_ids
+    df = df[df['customer_id'].notna()]
+    df = df.assign(customer_id=df['customer_id'].str.strip())
+    df = df[df['customer_id'] != ''].drop_duplicates('customer_id', keep='last')
+    
+    customers = pd.DataFrame({'customer_id': df['customer_id']})
+    for col in ('email', 'country'):
+        customers[col] = _clean_str(df[col]) if col in df.columns else None
+    if 'created_at' in df.columns:
+        customers['created_at'] = parse_date_column(df['created_at'])
+    
+    if customers.empty:
+        return
+    
+    # Missing email/country keep the stored value,
+    # created_at is overwritten when the CSV provides the column
+    insert = _insert_for(db)
+    if insert is None:
+        _upsert_fallback(db, Customer, 'customer_id', customers, keep_existing=('email', 'country'))
+        return
+    
+    table = Customer.__table__
+    stmt, records = _upsert_source(db, insert, table, customers)
+    update_cols = {
+        'email': func.coalesce(stmt.excluded.email, table.c.email),
+        'country': func.coalesce(stmt.excluded.country, table.c.country),
+    }
+    if 'created_at' in customers.columns:
+        update_cols['created_at'] = stmt.excluded.created_at
+    stmt = stmt.on_conflict_do_update(index_elements=['customer_id'], set_=update_cols)
+    db.execute(stmt, records)
+
+
+def _upsert_orders(db: Session, df: pd.DataFrame) -> None:
+    """Upsert one chunk of the orders CSV with a single statement."""
+    # Clean whole columns at once; the last row wins for duplicate order_ids
+    df = df[df['order_id'].notna()]
+    df = df.assign(order_id=df['order_id'].str.strip())
+    df = df[df['order_id'] != ''].drop_duplicates('order_id', keep='last')
+    
+    orders = pd.DataFrame({
+        'order_id': df['order_id'],
+        'customer_id': df['customer_id'].str.strip(),
+        'order_date': parse_date_column(df['order_date']),
+        'order_amount': df['order_amount'],
+    })
+    invalid_dates = orders['order_date'].isna()
+    if invalid_dates.any():
+        raise ValueError(f"Invalid order_date for order {orders.loc[invalid_dates, 'order_id'].iloc[0]}")
+    orders['currency'] = _clean_str(df['currency']).fillna('EUR') if 'currency' in df.columns else 'EUR'
+    orders['status'] = _clean_str(df['status']).fillna('completed') if 'status' in df.columns else 'completed'
+    
+    if orders.empty:
+        return
+    
+    # Existing orders are overwritten with the CSV values
+    insert = _insert_for(db)
+    if insert is None:
+        _upsert_fallback(db, Order, 'order_id', orders)
+        return
+    
+    stmt, records = _upsert_source(db, insert, Order.__table__, orders)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['order_id'],
+        set_={
+            col: stmt.excluded[col]
+            for col in ('customer_id', 'order_date', 'order_amount', 'currency', 'status')
+        }
+    )
+    db.execute(stmt, records)
+
+
 def ingest_customers_from_csv(db: Session, csv_path: Optional[str] = None) -> int:
     """
     Ingest customers from CSV file.
@@ -42,6 +253,8 @@ def ingest_customers_from_csv(db: Session, csv_path: Optional[str] = None) -> in
         db: Database session
         csv_path: Path to CSV file. If None, uses settings.DATA_DIR/customers.csv
     
+    The file is read and committed in chunks of INGEST_CHUNK_SIZE rows.
+    
     Returns:
         Number of NEW customers inserted (bestaande klanten worden alleen geüpdatet)
     """
@@ -52,42 +265,24 @@ def ingest_customers_from_csv(db: Session, csv_path: Optional[str] = None) -> in
     if not csv_path.exists():
         raise FileNotFoundError(f"Customers CSV not found: {csv_path}")
     
-    df = pd.read_csv(csv_path)
-    
-    # Validate required columns
-    if 'customer_id' not in df.columns:
-        raise ValueError("CSV must contain 'customer_id' column")
+    before = db.query(func.count(Customer.id)).scalar()
     
-    count = 0
-    for _, row in df.iterrows():
-        customer_id = str(row['customer_id']).strip()
-        if not customer_id:
-            continue
-        
-        # Check if customer exists
-        existing = db.query(Customer).filter(Customer.customer_id == customer_id).first()
+    # Stream the file: each chunk is upserted and committed before the next is read
+    reader = pd.read_csv(
+        csv_path,
+        chunksize=INGEST_CHUNK_SIZE,
+        usecols=lambda col: col in CUSTOMER_CSV_DTYPES,
+        dtype=CUSTOMER_CSV_DTYPES,
+    )
+    for df in reader:
+        # Validate required columns
+        if 'customer_id' not in df.columns:
+            raise ValueError("CSV must contain 'customer_id' column")
         
-        if existing:
-            # Update existing customer
-            if 'email' in df.columns and pd.notna(row.get('email')):
-                existing.email = str(row['email']).strip()
-            if 'country' in df.columns and pd.notna(row.get('country')):
-                existing.country = str(row['country']).strip()
-            if 'created_at' in df.columns:
-                existing.created_at = parse_date(row.get('created_at'))
-        else:
-            # Create new customer
-            customer = Customer(
-                customer_id=customer_id,
-                email=str(row['email']).strip() if 'email' in df.columns and pd.notna(row.get('email')) else None,
-                country=str(row['country']).strip() if 'country' in df.columns and pd.notna(row.get('country')) else None,
-                created_at=parse_date(row.get('created_at')) if 'created_at' in df.columns else None
-            )
-            db.add(customer)
-            count += 1
-    
-    db.commit()
-    return count
+        _upsert_customers(db, df)
+        db.commit()
+    
+    return db.query(func.count(Customer.id)).scalar() - before
 
 
 def ingest_orders_from_csv(db: Session, csv_path: Optional[str] = None) -> int:
@@ -106,6 +301,9 @@ def ingest_orders_from_csv(db: Session, csv_path: Optional[str] = None) -> int:
         db: Database session
         csv_path: Path to CSV file. If None, uses settings.DATA_DIR/orders.csv
     
+    The file is read and committed in chunks of INGEST_CHUNK_SIZE rows;
+    chunks before an invalid row stay committed.
+    
     Returns:
         Number of NEW orders inserted (bestaande orders worden alleen geüpdatet)
     """
@@ -116,54 +314,26 @@ def ingest_orders_from_csv(db: Session, csv_path: Optional[str] = None) -> int:
     if not csv_path.exists():
         raise FileNotFoundError(f"Orders CSV not found: {csv_path}")
     
-    df = pd.read_csv(csv_path)
-    
-    # Validate required columns
     required_cols = ['order_id', 'customer_id', 'order_date', 'order_amount']
-    missing = [col for col in required_cols if col not in df.columns]
-    if missing:
-        raise ValueError(f"CSV must contain columns: {', '.join(missing)}")
-    
-    count = 0
-    for _, row in df.iterrows():
-        order_id = str(row['order_id']).strip()
-        if not order_id:
-            continue
-        
-        # Check if order exists
-        existing = db.query(Order).filter(Order.order_id == order_id).first()
-        
-        customer_id = str(row['customer_id']).strip()
-        order_date = parse_date(row['order_date'])
-        if order_date is None:
-            raise ValueError(f"Invalid order_date for order {order_id}")
-        
-        order_amount = float(row['order_amount'])
-        currency = str(row.get('currency', 'EUR')).strip() if pd.notna(row.get('currency')) else 'EUR'
-        status = str(row.get('status', 'completed')).strip() if pd.notna(row.get('status')) else 'completed'
+    before = db.query(func.count(Order.id)).scalar()
+    
+    # Stream the file: each chunk is upserted and committed before the next is read
+    reader = pd.read_csv(
+        csv_path,
+        chunksize=INGEST_CHUNK_SIZE,
+        usecols=lambda col: col in ORDER_CSV_DTYPES,
+        dtype=ORDER_CSV_DTYPES,
+    )
+    for df in reader:
+        # Validate required columns
+        missing = [col for col in required_cols if col not in df.columns]
+        if missing:
+            raise ValueError(f"CSV must contain columns: {', '.join(missing)}")
         
-        if existing:
-            # Update existing order
-            existing.customer_id = customer_id
-            existing.order_date = order_date
-            existing.order_amount = order_amount
-            existing.currency = currency
-            existing.status = status
-        else:
-            # Create new order
-            order = Order(
-                order_id=order_id,
-                customer_id=customer_id,
-                order_date=order_date,
-                order_amount=order_amount,
-                currency=currency,
-                status=status
-            )
-            db.add(order)
-            count += 1
-    
-    db.commit()
-    return count
+        _upsert_orders(db, df)
+        db.commit()
+    
+    return db.query(func.count(Order.id)).scalar() - before
 
 
 def ingest_all(db: Session) -> dict:
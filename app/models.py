@@ -1,5 +1,5 @@
 """SQLAlchemy database models."""
-from sqlalchemy import Column, Integer, String, Numeric, DateTime, ForeignKey, UniqueConstraint, Index
+from sqlalchemy import Column, Integer, String, Numeric, Float, DateTime, ForeignKey, ForeignKeyConstraint, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.db import Base
@@ -43,7 +43,7 @@ class RFMFeature(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     customer_id = Column(String, ForeignKey("customers.customer_id"), index=True, nullable=False)
-    calc_date = Column(DateTime, nullable=False, index=True)
+    calc_date = Column(DateTime, nullable=False)
     recency_days = Column(Integer, nullable=False)
     frequency = Column(Integer, nullable=False)
     monetary = Column(Numeric(10, 2), nullable=False)
@@ -55,6 +55,12 @@ class RFMFeature(Base):
     __table_args__ = (
         UniqueConstraint('customer_id', 'calc_date', name='uq_customer_calc_date'),
         Index('idx_customer_calc_date', 'customer_id', 'calc_date'),
+        # Queries filter on calc_date first and join on customer_id;
+        # the RFM values are included so the visualization join is index-only on Postgres
+        Index(
+            'idx_rfm_calc_date_customer', 'calc_date', 'customer_id',
+            postgresql_include=['recency_days', 'frequency', 'monetary']
+        ),
     )
 
 
@@ -64,10 +70,10 @@ class CustomerCluster(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     customer_id = Column(String, ForeignKey("customers.customer_id"), index=True, nullable=False)
-    calc_date = Column(DateTime, nullable=False, index=True)
+    calc_date = Column(DateTime, nullable=False)
     cluster_id = Column(Integer, nullable=False)  # Raw K-means label
     segment_name = Column(String, nullable=False)  # Human-friendly label
-    cluster_score = Column(String, nullable=True)  # JSON string with metrics (optional)
+    cluster_score = Column(String, nullable=True)  # JSON string with metrics (optional, centroids live in cluster_centroids)
     
     # Relationship
     customer = relationship("Customer", back_populates="clusters")
@@ -76,5 +82,40 @@ class CustomerCluster(Base):
     __table_args__ = (
         UniqueConstraint('customer_id', 'calc_date', name='uq_customer_cluster_calc_date'),
         Index('idx_customer_cluster_calc_date', 'customer_id', 'calc_date'),
+        # Queries filter on calc_date (and segment_name) first and join on customer_id
+        Index(
+            'idx_cluster_calc_date_customer', 'calc_date', 'customer_id',
+            postgresql_include=['segment_name', 'cluster_id']
+        ),
+        Index('idx_cluster_calc_date_segment', 'calc_date', 'segment_name', 'customer_id'),
+        ForeignKeyConstraint(
+            ['calc_date', 'cluster_id'],
+            ['cluster_centroids.calc_date', 'cluster_centroids.cluster_id'],
+            name='fk_customer_cluster_centroid'
+        ),
+    )
+
+
+class ClusterCentroid(Base):
+    """
+    K-means cluster centroids, stored once per cluster per date.
+    
+    The centroid values are the exact RFM means of the cluster's customers
+    (original scale), so they double as the per-segment statistics.
+    """
+    __tablename__ = "cluster_centroids"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    calc_date = Column(DateTime, nullable=False, index=True)
+    cluster_id = Column(Integer, nullable=False)  # Raw K-means label
+    segment_name = Column(String, nullable=False)  # Human-friendly label
+    customer_count = Column(Integer, nullable=False)
+    recency_days = Column(Float, nullable=False)
+    frequency = Column(Float, nullable=False)
+    monetary = Column(Float, nullable=False)
+    
+    # Unique constraint: one centroid per cluster per date
+    __table_args__ = (
+        UniqueConstraint('calc_date', 'cluster_id', name='uq_centroid_calc_date_cluster'),
     )
 
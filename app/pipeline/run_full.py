@@ -1,11 +1,12 @@
 """Full pipeline orchestration: ingest -> RFM -> clustering."""
+from sqlalchemy import delete
 from sqlalchemy.orm import Session
 from datetime import datetime
 from typing import Optional
 from app.db import SessionLocal
 from app.config import settings
-from app import ingestion, rfm, clustering
-from app.models import RFMFeature, CustomerCluster, Customer, Order
+from app import ingestion, rfm, clustering, visualization
+from app.models import RFMFeature, CustomerCluster, ClusterCentroid, Customer, Order
 
 
 def run_full_pipeline(
@@ -51,6 +52,8 @@ def run_full_pipeline(
             # Extra inzicht: totalen in de database na ingestie
             total_customers = db.query(Customer).count()
             total_orders = db.query(Order).count()
+            # End the read transaction; each following step runs in its own transaction
+            db.commit()
 
             results['ingestion'] = {
                 **ingestion_results,
@@ -58,43 +61,47 @@ def run_full_pipeline(
                 'orders_total_in_db': total_orders,
             }
         except Exception as e:
+            db.rollback()
             results['errors'].append(f"Ingestion error: {str(e)}")
             results['ingestion'] = {'error': str(e)}
         
-        # Step 2: Calculate RFM
+        # Step 2: Calculate RFM (one transaction: commits on success, rolls back on error)
         try:
-            # Delete existing RFM features for this calc_date (idempotency)
-            db.query(RFMFeature).filter(RFMFeature.calc_date == calc_date).delete()
-            
-            rfm_features = rfm.calculate_rfm(db, calc_date, window_days)
-            db.add_all(rfm_features)
-            db.commit()
+            with db.begin():
+                # Delete existing RFM features for this calc_date (idempotency)
+                db.execute(delete(RFMFeature).where(RFMFeature.calc_date == calc_date))
+                
+                rfm_features = rfm.calculate_rfm(db, calc_date, window_days)
+                if rfm_features:
+                    db.execute(RFMFeature.__table__.insert(), rfm_features)
             
             results['rfm'] = {
                 'customers_processed': len(rfm_features)
             }
         except Exception as e:
-            db.rollback()
             results['errors'].append(f"RFM calculation error: {str(e)}")
             results['rfm'] = {'error': str(e)}
         
-        # Step 3: Run clustering
+        # Step 3: Run clustering (one transaction: commits on success, rolls back on error)
         try:
-            # Delete existing cluster assignments for this calc_date (idempotency)
-            db.query(CustomerCluster).filter(CustomerCluster.calc_date == calc_date).delete()
-            
-            cluster_assignments, centroids = clustering.run_kmeans_clustering(
-                db, calc_date, k
-            )
-            db.add_all(cluster_assignments)
-            db.commit()
+            with db.begin():
+                # Delete existing cluster assignments and centroids for this calc_date (idempotency)
+                db.execute(delete(CustomerCluster).where(CustomerCluster.calc_date == calc_date))
+                db.execute(delete(ClusterCentroid).where(ClusterCentroid.calc_date == calc_date))
+                
+                cluster_assignments, cluster_centroids, centroids = clustering.run_kmeans_clustering(
+                    db, calc_date, k
+                )
+                # Plain Core executemany inserts; no ORM state is built per row
+                db.execute(ClusterCentroid.__table__.insert(), cluster_centroids)
+                db.execute(CustomerCluster.__table__.insert(), cluster_assignments)
+            visualization.clear_cluster_cache()
             
             results['clustering'] = {
                 'customers_clustered': len(cluster_assignments),
                 'clusters_created': k
             }
         except Exception as e:
-            db.rollback()
             results['errors'].append(f"Clustering error: {str(e)}")
             results['clustering'] = {'error': str(e)}
         
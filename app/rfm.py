@@ -1,9 +1,10 @@
 """RFM (Recency, Frequency, Monetary) calculation logic."""
+import pandas as pd
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
+from sqlalchemy import Float, and_, cast, func, select
 from datetime import datetime, timedelta
 from decimal import Decimal
-from typing import List, Tuple
+from typing import List, Tuple, Dict
 from app.models import Customer, Order, RFMFeature
 
 
@@ -11,7 +12,7 @@ def calculate_rfm(
     db: Session,
     calc_date: datetime,
     window_days: int = 365
-) -> List[RFMFeature]:
+) -> List[Dict]:
     """
     Calculate RFM features for all customers.
     
@@ -21,7 +22,7 @@ def calculate_rfm(
         window_days: Number of days to look back (default: 365)
     
     Returns:
-        List of RFMFeature objects (not yet committed to DB)
+        List of rfm_features row mappings (not yet written to DB)
     
     Convention for customers with no orders in window:
     - recency_days: set to window_days + 1 (very high, indicating no recent activity)
@@ -30,46 +31,43 @@ def calculate_rfm(
     """
     window_start = calc_date - timedelta(days=window_days)
     
-    # Get all customers
-    customers = db.query(Customer).all()
-    rfm_features = []
-    
-    for customer in customers:
-        # Get orders in the time window with status 'completed'
-        orders = db.query(Order).filter(
-            and_(
-                Order.customer_id == customer.customer_id,
-                Order.order_date >= window_start,
-                Order.order_date <= calc_date,
-                Order.status == 'completed'
-            )
-        ).all()
-        
-        if not orders:
-            # No orders in window: set high recency, zero frequency and monetary
-            recency_days = window_days + 1
-            frequency = 0
-            monetary = Decimal('0.00')
-        else:
-            # Calculate recency: days since most recent order
-            max_order_date = max(order.order_date for order in orders)
-            recency_days = (calc_date - max_order_date).days
-            
-            # Frequency: number of orders in window
-            frequency = len(orders)
-            
-            # Monetary: sum of order amounts
-            monetary = sum(order.order_amount for order in orders)
-        
-        # Create RFM feature record
-        rfm_feature = RFMFeature(
-            customer_id=customer.customer_id,
-            calc_date=calc_date,
-            recency_days=recency_days,
-            frequency=frequency,
-            monetary=monetary
+    # Aggregate completed orders in the window per customer in one query
+    order_stats_stmt = select(
+        Order.customer_id,
+        func.max(Order.order_date).label('last_order_date'),
+        func.count(Order.id).label('frequency'),
+        cast(func.sum(Order.order_amount), Float).label('monetary')
+    ).where(
+        and_(
+            Order.order_date >= window_start,
+            Order.order_date <= calc_date,
+            Order.status == 'completed'
         )
-        rfm_features.append(rfm_feature)
+    ).group_by(
+        Order.customer_id
+    )
+    
+    conn = db.connection()
+    customers_df = pd.read_sql(select(Customer.customer_id), conn)
+    order_stats_df = pd.read_sql(order_stats_stmt, conn, parse_dates=['last_order_date'])
+    
+    # Left join so customers without orders in the window are kept
+    df = customers_df.merge(order_stats_df, on='customer_id', how='left')
+    
+    # Recency: days since most recent order; no orders -> high recency, zero frequency and monetary
+    df['recency_days'] = (
+        (pd.Timestamp(calc_date) - df['last_order_date']).dt.days
+        .fillna(window_days + 1)
+        .astype(int)
+    )
+    df['frequency'] = df['frequency'].fillna(0).astype(int)
+    # Monetary is summed as float64 and quantized to cents once per customer
+    cents = (df['monetary'].astype('float64').fillna(0.0) * 100).round().astype('int64')
+    df['monetary'] = [Decimal(c).scaleb(-2) for c in cents.tolist()]
+    
+    rfm_features = df[['customer_id', 'recency_days', 'frequency', 'monetary']].to_dict('records')
+    for row in rfm_features:
+        row['calc_date'] = calc_date
     
     return rfm_features
 
@@ -2,61 +2,121 @@
 import matplotlib
 matplotlib.use('Agg')  # Use non-interactive backend
 import matplotlib.pyplot as plt
+from matplotlib.colors import ListedColormap
 import plotly.graph_objects as go
 import plotly.express as px
+import pandas as pd
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import Optional, Tuple
+from sqlalchemy import func, select
+from typing import Optional, Tuple, Dict, List
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import io
+import time
 import base64
-from app.models import Customer, RFMFeature, CustomerCluster
+from app.models import RFMFeature, CustomerCluster
 
+CLUSTER_DATA_COLUMNS = ['customer_id', 'recency_days', 'frequency', 'monetary', 'segment_name', 'cluster_id']
 
-def get_cluster_data(db: Session, calc_date: Optional[datetime] = None):
+# PNG output for the plot endpoints: fast zlib level instead of the default 6
+PNG_SAVE_OPTIONS = dict(format='png', bbox_inches='tight', dpi=90, pil_kwargs={'compress_level': 1})
+
+# get_cluster_data results per calc_date as (fetched_at, data), shared by all plot
+# endpoints. Entries expire after CLUSTER_CACHE_TTL seconds, so a pipeline run in
+# another process (CLI, other worker) shows up without clear_cluster_cache().
+CLUSTER_CACHE_SIZE = 8
+CLUSTER_CACHE_TTL = 30.0
+_CLUSTER_DATA_CACHE: Dict[datetime, Tuple[float, pd.DataFrame]] = {}
+
+
+def clear_cluster_cache() -> None:
+    """Drop cached cluster data; call after the pipeline writes new clusters."""
+    _CLUSTER_DATA_CACHE.clear()
+
+
+def _read_sql_frames(db: Session, statements: List) -> List[pd.DataFrame]:
+    """
+    Read several SELECTs into DataFrames that all see the same database state.
+    
+    On PostgreSQL the queries run concurrently, each on its own pooled
+    connection. A coordinating REPEATABLE READ transaction exports its snapshot
+    and every reader imports it (as pg_dump does), so the reads cannot see
+    different pipeline commits. Other databases (e.g. a single shared SQLite
+    connection) read them one after another on the session's connection.
+    """
+    engine = db.get_bind()
+    if engine.dialect.name != 'postgresql':
+        conn = db.connection()
+        return [pd.read_sql(stmt, conn) for stmt in statements]
+    
+    with engine.connect().execution_options(isolation_level="REPEATABLE READ") as coordinator:
+        # The exported snapshot stays importable while this transaction is open
+        with coordinator.begin():
+            snapshot_id = coordinator.exec_driver_sql("SELECT pg_export_snapshot()").scalar()
+            
+            def read(stmt) -> pd.DataFrame:
+                with engine.connect().execution_options(isolation_level="REPEATABLE READ") as conn:
+                    with conn.begin():
+                        # Must be the first statement of the reader's transaction
+                        conn.exec_driver_sql("SET TRANSACTION SNAPSHOT %s", (snapshot_id,))
+                        return pd.read_sql(stmt, conn)
+            
+            with ThreadPoolExecutor(max_workers=len(statements)) as pool:
+                return list(pool.map(read, statements))
+
+
+def get_cluster_data(db: Session, calc_date: Optional[datetime] = None) -> pd.DataFrame:
     """
     Get RFM and cluster data for visualization.
     
+    Non-empty results are cached per calc_date for CLUSTER_CACHE_TTL seconds
+    (or until clear_cluster_cache() is called), so the plots of one dashboard
+    view share a single read.
+    
     Returns:
-        List of dicts with customer_id, recency_days, frequency, monetary, segment_name, cluster_id
+        DataFrame with columns customer_id, recency_days, frequency, monetary,
+        segment_name, cluster_id (one row per customer)
     """
     # If calc_date not provided, get the latest one
     if calc_date is None:
         latest_calc = db.query(func.max(CustomerCluster.calc_date)).scalar()
         if latest_calc is None:
-            return []
+            return pd.DataFrame(columns=CLUSTER_DATA_COLUMNS)
         calc_date = latest_calc
     
-    # Get all customers with RFM and cluster data
-    results = db.query(
-        Customer.customer_id,
+    cached = _CLUSTER_DATA_CACHE.get(calc_date)
+    if cached is not None and time.monotonic() - cached[0] < CLUSTER_CACHE_TTL:
+        return cached[1]
+    
+    # Two simple range scans on the covering (calc_date, customer_id) indexes,
+    # joined on customer_id in pandas
+    rfm_stmt = select(
+        RFMFeature.customer_id,
         RFMFeature.recency_days,
         RFMFeature.frequency,
-        RFMFeature.monetary,
+        RFMFeature.monetary
+    ).where(RFMFeature.calc_date == calc_date)
+    cluster_stmt = select(
+        CustomerCluster.customer_id,
         CustomerCluster.segment_name,
         CustomerCluster.cluster_id
-    ).join(
-        RFMFeature,
-        Customer.customer_id == RFMFeature.customer_id
-    ).join(
-        CustomerCluster,
-        Customer.customer_id == CustomerCluster.customer_id
-    ).filter(
-        RFMFeature.calc_date == calc_date,
-        CustomerCluster.calc_date == calc_date
-    ).all()
-    
-    return [
-        {
-            'customer_id': r.customer_id,
-            'recency_days': r.recency_days,
-            'frequency': r.frequency,
-            'monetary': float(r.monetary),
-            'segment_name': r.segment_name,
-            'cluster_id': r.cluster_id
-        }
-        for r in results
-    ]
+    ).where(CustomerCluster.calc_date == calc_date)
+    
+    rfm_df, cluster_df = _read_sql_frames(db, [rfm_stmt, cluster_stmt])
+    data = rfm_df.merge(cluster_df, on='customer_id', how='inner')
+    # monetary as float64 for plotting
+    data['monetary'] = data['monetary'].astype('float64')
+    
+    # Nothing to cache before the pipeline has written clusters for calc_date
+    if data.empty:
+        return data
+    
+    # Keep only the most recent calc_dates
+    _CLUSTER_DATA_CACHE.pop(calc_date, None)
+    if len(_CLUSTER_DATA_CACHE) >= CLUSTER_CACHE_SIZE:
+        _CLUSTER_DATA_CACHE.pop(next(iter(_CLUSTER_DATA_CACHE)))
+    _CLUSTER_DATA_CACHE[calc_date] = (time.monotonic(), data)
+    return data
 
 
 def create_matplotlib_plot(
@@ -77,7 +137,7 @@ def create_matplotlib_plot(
     """
     data = get_cluster_data(db, calc_date)
     
-    if not data:
+    if data.empty:
         # Create empty plot with message
         fig, ax = plt.subplots(figsize=(10, 6))
         ax.text(0.5, 0.5, 'No cluster data available.\nPlease run the pipeline first.', 
@@ -85,62 +145,58 @@ def create_matplotlib_plot(
         ax.set_xticks([])
         ax.set_yticks([])
         buf = io.BytesIO()
-        plt.savefig(buf, format='png', bbox_inches='tight', dpi=100)
+        plt.savefig(buf, **PNG_SAVE_OPTIONS)
         plt.close()
         buf.seek(0)
         return buf
     
-    # Extract data
-    recency = [d['recency_days'] for d in data]
-    frequency = [d['frequency'] for d in data]
-    monetary = [d['monetary'] for d in data]
-    segments = [d['segment_name'] for d in data]
-    
-    # Get unique segments for color mapping
-    unique_segments = sorted(set(segments))
-    colors = plt.cm.Set3(range(len(unique_segments)))
-    segment_colors = {seg: colors[i] for i, seg in enumerate(unique_segments)}
+    # Encode segments as integer codes (categories are sorted) for color mapping
+    segments = pd.Categorical(data['segment_name'])
+    n_segments = len(segments.categories)
+    segment_cmap = ListedColormap(plt.cm.Set3(range(n_segments)))
     
     # Create figure
     fig, ax = plt.subplots(figsize=(12, 8))
     
     # Plot based on type
     if plot_type == "frequency_monetary":
-        x_data, x_label = frequency, "Frequency"
-        y_data, y_label = monetary, "Monetary Value"
+        x_col, x_label = 'frequency', "Frequency"
+        y_col, y_label = 'monetary', "Monetary Value"
     elif plot_type == "recency_frequency":
-        x_data, x_label = recency, "Recency (days)"
-        y_data, y_label = frequency, "Frequency"
+        x_col, x_label = 'recency_days', "Recency (days)"
+        y_col, y_label = 'frequency', "Frequency"
     elif plot_type == "recency_monetary":
-        x_data, x_label = recency, "Recency (days)"
-        y_data, y_label = monetary, "Monetary Value"
+        x_col, x_label = 'recency_days', "Recency (days)"
+        y_col, y_label = 'monetary', "Monetary Value"
     else:
-        x_data, x_label = frequency, "Frequency"
-        y_data, y_label = monetary, "Monetary Value"
-    
-    # Plot each segment
-    for segment in unique_segments:
-        indices = [i for i, s in enumerate(segments) if s == segment]
-        ax.scatter(
-            [x_data[i] for i in indices],
-            [y_data[i] for i in indices],
-            c=[segment_colors[segment]],
-            label=segment,
-            alpha=0.6,
-            s=50
-        )
+        x_col, x_label = 'frequency', "Frequency"
+        y_col, y_label = 'monetary', "Monetary Value"
+    
+    # All segments in one scatter call, colored by segment code
+    scatter = ax.scatter(
+        data[x_col].to_numpy(),
+        data[y_col].to_numpy(),
+        c=segments.codes,
+        cmap=segment_cmap,
+        vmin=-0.5,
+        vmax=n_segments - 0.5,
+        alpha=0.6,
+        s=50,
+        rasterized=True
+    )
     
     ax.set_xlabel(x_label, fontsize=12)
     ax.set_ylabel(y_label, fontsize=12)
     ax.set_title(f'Customer Clusters - {x_label} vs {y_label}', fontsize=14, fontweight='bold')
-    ax.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
+    handles, _ = scatter.legend_elements(num=None)
+    ax.legend(handles, list(segments.categories), bbox_to_anchor=(1.05, 1), loc='upper left')
     ax.grid(True, alpha=0.3)
     
     plt.tight_layout()
     
     # Save to buffer
     buf = io.BytesIO()
-    plt.savefig(buf, format='png', bbox_inches='tight', dpi=100)
+    plt.savefig(buf, **PNG_SAVE_OPTIONS)
     plt.close()
     buf.seek(0)
     return buf
@@ -164,7 +220,7 @@ def create_plotly_plot(
     """
     data = get_cluster_data(db, calc_date)
     
-    if not data:
+    if data.empty:
         fig = go.Figure()
         fig.add_annotation(
             text="No cluster data available.<br>Please run the pipeline first.",
@@ -174,49 +230,35 @@ def create_plotly_plot(
         )
         return fig.to_html(include_plotlyjs='cdn')
     
-    # Extract data
-    recency = [d['recency_days'] for d in data]
-    frequency = [d['frequency'] for d in data]
-    monetary = [d['monetary'] for d in data]
-    segments = [d['segment_name'] for d in data]
-    customer_ids = [d['customer_id'] for d in data]
-    
-    # Create hover text
-    hover_text = [
-        f"Customer: {cid}<br>Segment: {seg}<br>Recency: {r} days<br>Frequency: {f}<br>Monetary: ${m:.2f}"
-        for cid, seg, r, f, m in zip(customer_ids, segments, recency, frequency, monetary)
-    ]
-    
     # Determine axes based on plot type
-    if plot_type == "frequency_monetary":
-        x_data, x_label = frequency, "Frequency"
-        y_data, y_label = monetary, "Monetary Value ($)"
-    elif plot_type == "recency_frequency":
-        x_data, x_label = recency, "Recency (days)"
-        y_data, y_label = frequency, "Frequency"
+    if plot_type == "recency_frequency":
+        x_col, y_col = 'recency_days', 'frequency'
     elif plot_type == "recency_monetary":
-        x_data, x_label = recency, "Recency (days)"
-        y_data, y_label = monetary, "Monetary Value ($)"
+        x_col, y_col = 'recency_days', 'monetary'
     else:
-        x_data, x_label = frequency, "Frequency"
-        y_data, y_label = monetary, "Monetary Value ($)"
+        x_col, y_col = 'frequency', 'monetary'
+    labels = {
+        'recency_days': 'Recency (days)',
+        'frequency': 'Frequency',
+        'monetary': 'Monetary Value ($)',
+        'segment_name': 'Segment'
+    }
+    x_label, y_label = labels[x_col], labels[y_col]
     
-    # Create scatter plot
+    # Create scatter plot straight from the DataFrame columns
     fig = px.scatter(
-        x=x_data,
-        y=y_data,
-        color=segments,
-        hover_name=customer_ids,
+        data,
+        x=x_col,
+        y=y_col,
+        color='segment_name',
+        hover_name='customer_id',
         hover_data={
-            'Recency (days)': recency,
-            'Frequency': frequency,
-            'Monetary ($)': [f"${m:.2f}" for m in monetary]
-        },
-        labels={
-            'x': x_label,
-            'y': y_label,
-            'color': 'Segment'
+            'recency_days': True,
+            'frequency': True,
+            'monetary': ':$.2f',
+            'segment_name': False
         },
+        labels=labels,
         title=f'Customer Clusters - {x_label} vs {y_label}',
         width=1000,
         height=700
@@ -245,7 +287,7 @@ def create_3d_plotly_plot(db: Session, calc_date: Optional[datetime] = None) ->
     """
     data = get_cluster_data(db, calc_date)
     
-    if not data:
+    if data.empty:
         fig = go.Figure()
         fig.add_annotation(
             text="No cluster data available.<br>Please run the pipeline first.",
@@ -255,27 +297,18 @@ def create_3d_plotly_plot(db: Session, calc_date: Optional[datetime] = None) ->
         )
         return fig.to_html(include_plotlyjs='cdn')
     
-    # Extract data
-    recency = [d['recency_days'] for d in data]
-    frequency = [d['frequency'] for d in data]
-    monetary = [d['monetary'] for d in data]
-    segments = [d['segment_name'] for d in data]
-    customer_ids = [d['customer_id'] for d in data]
-    
     # Create 3D scatter plot
     fig = go.Figure()
     
     # Plot each segment separately for better legend
-    unique_segments = sorted(set(segments))
-    for segment in unique_segments:
-        indices = [i for i, s in enumerate(segments) if s == segment]
+    for segment, group in data.groupby('segment_name', sort=True):
         fig.add_trace(go.Scatter3d(
-            x=[recency[i] for i in indices],
-            y=[frequency[i] for i in indices],
-            z=[monetary[i] for i in indices],
+            x=group['recency_days'].to_numpy(),
+            y=group['frequency'].to_numpy(),
+            z=group['monetary'].to_numpy(),
             mode='markers',
             name=segment,
-            text=[customer_ids[i] for i in indices],
+            text=group['customer_id'].to_numpy(),
             hovertemplate='<b>%{text}</b><br>' +
                          'Recency: %{x} days<br>' +
                          'Frequency: %{y}<br>' +
@@ -0,0 +1,77 @@
+"""Shared test fixtures."""
+import pytest
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+import app.db
+from app.db import Base
+
+# Tests run against an in-memory SQLite database instead of the configured Postgres.
+# StaticPool keeps the single connection (and with it the database) alive and
+# shares it with the TestClient's worker threads.
+engine = create_engine(
+    "sqlite://",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+
+
+@event.listens_for(engine, "connect")
+def _disable_pysqlite_transaction_handling(dbapi_connection, connection_record):
+    # pysqlite's own BEGIN handling breaks SAVEPOINTs; let SQLAlchemy emit BEGIN instead
+    dbapi_connection.isolation_level = None
+
+
+@event.listens_for(engine, "begin")
+def _emit_begin(connection):
+    connection.exec_driver_sql("BEGIN")
+
+
+# Patch before app.api and the test modules are imported
+app.db.engine = engine
+app.db.SessionLocal = SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _schema():
+    """Create the database schema once per test session (autouse, so fixtures need not request it)."""
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+@contextmanager
+def _rolled_back_session():
+    """
+    Yield a session inside a transaction that is rolled back on exit.
+
+    Commits made through the session only release a SAVEPOINT, so nothing is persisted.
+    """
+    connection = engine.connect()
+    transaction = connection.begin()
+    db = SessionLocal(bind=connection, join_transaction_mode="create_savepoint")
+    try:
+        yield db
+    finally:
+        db.close()
+        transaction.rollback()
+        connection.close()
+
+
+@pytest.fixture(scope="session")
+def rolled_back_session():
+    """
+    Context manager factory for module-scoped fixtures that need the database.
+
+    The transaction must be closed before the next test opens its own: the
+    in-memory database has a single shared connection.
+    """
+    return _rolled_back_session
+
+
+@pytest.fixture
+def db_session(rolled_back_session):
+    """Create a test database session that is rolled back after the test."""
+    with rolled_back_session() as db:
+        yield db
@@ -2,51 +2,115 @@
 import pytest
 from fastapi.testclient import TestClient
 from app.api import app
-from app.db import Base, engine, SessionLocal, get_db
-from app.models import Customer, Order, RFMFeature, CustomerCluster
+from app.db import get_db
+from app.models import Customer, Order, RFMFeature, CustomerCluster, ClusterCentroid
 from datetime import datetime, timedelta
 from decimal import Decimal
 
+CALC_DATE = datetime(2024, 1, 15)
 
-@pytest.fixture
-def db_session():
-    """Create a test database session."""
-    Base.metadata.create_all(bind=engine)
-    db = SessionLocal()
-    yield db
-    db.close()
-    Base.metadata.drop_all(bind=engine)
+
+@pytest.fixture(scope="session")
+def client():
+    """Create one test client for the whole test session."""
+    return TestClient(app)
+
+
+class TestReadOnlyEndpoints:
+    """Endpoints that only read: the tests share one database session for the class."""
+    
+    @pytest.fixture(scope="class", autouse=True)
+    def override_get_db(self, rolled_back_session):
+        """Point the database dependency at one session for all tests in the class."""
+        with rolled_back_session() as db:
+            def _get_db():
+                yield db
+            
+            app.dependency_overrides[get_db] = _get_db
+            yield
+            app.dependency_overrides.clear()
+    
+    def test_health_check(self, client):
+        """Test health check endpoint."""
+        response = client.get("/health")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["status"] == "ok"
+        assert "database" in data
+    
+    def test_get_segments_empty(self, client):
+        """Test getting segments when none exist."""
+        response = client.get("/segments")
+        assert response.status_code == 404
+    
+    def test_get_customer_not_found(self, client):
+        """Test getting a non-existent customer."""
+        response = client.get("/customers/NONEXISTENT")
+        assert response.status_code == 404
 
 
 @pytest.fixture
-def client(db_session):
-    """Create a test client with database dependency override."""
-    def override_get_db():
+def api_db_session(db_session):
+    """Point the database dependency at a per-test session that is rolled back."""
+    def _get_db():
         yield db_session
     
-    app.dependency_overrides[get_db] = override_get_db
-    client = TestClient(app)
-    yield client
+    app.dependency_overrides[get_db] = _get_db
+    yield db_session
     app.dependency_overrides.clear()
 
 
-def test_health_check(client):
-    """Test health check endpoint."""
-    response = client.get("/health")
-    assert response.status_code == 200
-    data = response.json()
-    assert data["status"] == "ok"
-    assert "database" in data
-
-
-def test_get_segments_empty(client):
-    """Test getting segments when none exist."""
-    response = client.get("/segments")
-    assert response.status_code == 404
-
-
-def test_get_customer_not_found(client):
-    """Test getting a non-existent customer."""
-    response = client.get("/customers/NONEXISTENT")
-    assert response.status_code == 404
-
+def test_get_segment_customers_pagination(client, api_db_session):
+    """Test walking a segment's customers page by page with the next_cursor keyset."""
+    segments = ["Champions"] * 7 + ["Lost"] * 2
+    customer_ids = [f"C{i:03d}" for i in range(1, len(segments) + 1)]
+    
+    api_db_session.execute(Customer.__table__.insert(), [
+        {"customer_id": customer_id, "email": f"{customer_id}@test.com"} for customer_id in customer_ids
+    ])
+    api_db_session.execute(RFMFeature.__table__.insert(), [
+        {
+            "customer_id": customer_id,
+            "calc_date": CALC_DATE,
+            "recency_days": 10,
+            "frequency": 2,
+            "monetary": Decimal("50.00")
+        }
+        for customer_id in customer_ids
+    ])
+    api_db_session.execute(ClusterCentroid.__table__.insert(), [
+        {
+            "calc_date": CALC_DATE,
+            "cluster_id": cluster_id,
+            "segment_name": segment_name,
+            "customer_count": segments.count(segment_name),
+            "recency_days": 10.0,
+            "frequency": 2.0,
+            "monetary": 50.0
+        }
+        for cluster_id, segment_name in enumerate(["Champions", "Lost"])
+    ])
+    api_db_session.execute(CustomerCluster.__table__.insert(), [
+        {
+            "customer_id": customer_id,
+            "calc_date": CALC_DATE,
+            "cluster_id": 0 if segment_name == "Champions" else 1,
+            "segment_name": segment_name
+        }
+        for customer_id, segment_name in zip(customer_ids, segments)
+    ])
+    api_db_session.flush()
+    
+    pages = []
+    params = {"calc_date": CALC_DATE.isoformat(), "page_size": 3}
+    while True:
+        response = client.get("/segments/Champions/customers", params=params)
+        assert response.status_code == 200
+        data = response.json()
+        pages.append([customer["customer_id"] for customer in data["customers"]])
+        if data["next_cursor"] is None:
+            break
+        assert data["next_cursor"] == pages[-1][-1]
+        params["after"] = data["next_cursor"]
+    
+    assert pages == [customer_ids[0:3], customer_ids[3:6], customer_ids[6:7]]
@@ -4,80 +4,82 @@ import numpy as np
 from datetime import datetime
 from decimal import Decimal
 from sqlalchemy.orm import Session
-from app.models import Customer, RFMFeature, CustomerCluster
-from app.clustering import run_kmeans_clustering, map_cluster_to_segment
-from app.db import Base, engine, SessionLocal
+from app.models import Customer, RFMFeature, CustomerCluster, ClusterCentroid
+from app.clustering import (
+    run_kmeans_clustering, map_cluster_to_segment, standardize_inplace, backfill_cluster_centroids
+)
 
+CALC_DATE = datetime(2024, 1, 15)
+# Fixed seed so the K-means tests are deterministic
+RANDOM_STATE = 0
 
-@pytest.fixture
-def db_session():
-    """Create a test database session."""
-    Base.metadata.create_all(bind=engine)
-    db = SessionLocal()
-    yield db
-    db.close()
-    Base.metadata.drop_all(bind=engine)
 
+# Mock centroids (standardized space), shared by the segment mapping tests
+_CENTROIDS_FIXTURE = np.array([
+    [-1.0, 1.0, 1.0],  # Low recency, high freq, high monetary -> Champions
+    [1.0, -1.0, -1.0],  # High recency, low freq, low monetary -> At Risk
+    [-0.3, 0.8, 0.5],  # Medium -> Potential Loyalists
+])
 
-@pytest.fixture
-def sample_rfm_features(db_session):
-    """Create sample RFM features for clustering."""
-    calc_date = datetime(2024, 1, 15)
-    
-    # Create customers
-    customers = [
-        Customer(customer_id=f"C{i:03d}", email=f"customer{i}@test.com")
+
+def rfm_pattern(i):
+    """Return (recency, frequency, monetary) for the i-th sample customer."""
+    if i < 5:
+        # Champions: low recency, high frequency, high monetary
+        return 10 + i, 10 + i, Decimal("500.00") + Decimal(str(i * 50))
+    elif i < 10:
+        # At Risk: high recency, low frequency, low monetary
+        return 200 + i * 10, 1, Decimal("20.00")
+    elif i < 15:
+        # Loyal: low recency, high frequency, medium monetary
+        return 20 + i, 8, Decimal("200.00")
+    else:
+        # Mixed
+        return 100 + i, 3, Decimal("100.00")
+
+
+@pytest.fixture(scope="module")
+def sample_customers_data():
+    """Sample customer rows, built once per module."""
+    return [
+        {"customer_id": f"C{i:03d}", "email": f"customer{i}@test.com"}
         for i in range(1, 21)  # 20 customers
     ]
-    for customer in customers:
-        db_session.add(customer)
-    db_session.commit()
-    
-    # Create diverse RFM features
-    rfm_features = []
-    for i, customer in enumerate(customers):
-        # Create different patterns
-        if i < 5:
-            # Champions: low recency, high frequency, high monetary
-            recency = 10 + i
-            frequency = 10 + i
-            monetary = Decimal("500.00") + Decimal(str(i * 50))
-        elif i < 10:
-            # At Risk: high recency, low frequency, low monetary
-            recency = 200 + i * 10
-            frequency = 1
-            monetary = Decimal("20.00")
-        elif i < 15:
-            # Loyal: low recency, high frequency, medium monetary
-            recency = 20 + i
-            frequency = 8
-            monetary = Decimal("200.00")
-        else:
-            # Mixed
-            recency = 100 + i
-            frequency = 3
-            monetary = Decimal("100.00")
-        
-        rfm = RFMFeature(
-            customer_id=customer.customer_id,
-            calc_date=calc_date,
-            recency_days=recency,
-            frequency=frequency,
-            monetary=monetary
+
+
+@pytest.fixture(scope="module")
+def sample_rfm_data(sample_customers_data):
+    """Diverse sample RFM rows (one per customer), built once per module."""
+    return [
+        {
+            "customer_id": customer["customer_id"],
+            "calc_date": CALC_DATE,
+            "recency_days": recency,
+            "frequency": frequency,
+            "monetary": monetary
+        }
+        for customer, (recency, frequency, monetary) in zip(
+            sample_customers_data, map(rfm_pattern, range(len(sample_customers_data)))
         )
-        rfm_features.append(rfm)
-        db_session.add(rfm)
-    
-    db_session.commit()
-    return rfm_features
+    ]
+
+
+@pytest.fixture
+def sample_rfm_features(db_session, sample_customers_data, sample_rfm_data):
+    """Create sample RFM features for clustering."""
+    db_session.execute(Customer.__table__.insert(), sample_customers_data)
+    db_session.execute(RFMFeature.__table__.insert(), sample_rfm_data)
+    db_session.flush()
+    return sample_rfm_data
 
 
-def test_run_kmeans_clustering(db_session, sample_rfm_features):
+@pytest.mark.slow
+@pytest.mark.parametrize("k", [3, 4, 5])
+def test_run_kmeans_clustering(db_session, sample_rfm_features, k):
     """Test K-means clustering execution."""
-    calc_date = datetime(2024, 1, 15)
-    k = 4
-    
-    cluster_assignments, centroids = run_kmeans_clustering(db_session, calc_date, k)
+    cluster_assignments, cluster_centroids, centroids = run_kmeans_clustering(
+        db_session, CALC_DATE, k, random_state=RANDOM_STATE
+    )
     
     # Should have assignments for all customers
     assert len(cluster_assignments) == len(sample_rfm_features)
@@ -85,26 +87,80 @@ def test_run_kmeans_clustering(db_session, sample_rfm_features):
     # Should have k centroids
     assert centroids.shape[0] == k
     assert centroids.shape[1] == 3  # 3 features (R, F, M)
+    assert len(cluster_centroids) == k
+    assert sum(c['customer_count'] for c in cluster_centroids) == len(sample_rfm_features)
+    
+    # Persisted centroids are the exact (float64) means of each cluster's rows
+    features = np.array([
+        [row["recency_days"], row["frequency"], float(row["monetary"])]
+        for row in sample_rfm_features
+    ])
+    labels = np.array([assignment['cluster_id'] for assignment in cluster_assignments])
+    for centroid in cluster_centroids:
+        np.testing.assert_allclose(
+            [centroid['recency_days'], centroid['frequency'], centroid['monetary']],
+            features[labels == centroid['cluster_id']].mean(axis=0),
+            rtol=1e-12
+        )
     
     # All assignments should have segment names
     for assignment in cluster_assignments:
-        assert assignment.segment_name is not None
-        assert assignment.cluster_id >= 0
-        assert assignment.cluster_id < k
+        assert assignment['segment_name'] is not None
+        assert assignment['cluster_id'] >= 0
+        assert assignment['cluster_id'] < k
 
 
-def test_map_cluster_to_segment():
-    """Test cluster to segment name mapping."""
-    # Create mock centroids (standardized space)
-    centroids = np.array([
-        [-1.0, 1.0, 1.0],  # Low recency, high freq, high monetary -> Champions
-        [1.0, -1.0, -1.0],  # High recency, low freq, low monetary -> At Risk
-        [-0.3, 0.8, 0.5],  # Medium -> Potential Loyalists
+def test_backfill_cluster_centroids(db_session, sample_rfm_features):
+    """Test centroid backfill for a calc_date clustered before centroids were stored."""
+    # One cluster per rfm_pattern group of five customers, no centroid rows
+    db_session.execute(CustomerCluster.__table__.insert(), [
+        {
+            "customer_id": row["customer_id"],
+            "calc_date": CALC_DATE,
+            "cluster_id": i // 5,
+            "segment_name": f"Segment {i // 5}"
+        }
+        for i, row in enumerate(sample_rfm_features)
     ])
     
-    segment1 = map_cluster_to_segment(0, centroids)
-    assert segment1 == "Champions"
+    assert backfill_cluster_centroids(db_session) == [CALC_DATE]
+    # Already backfilled: nothing left to do
+    assert backfill_cluster_centroids(db_session) == []
     
-    segment2 = map_cluster_to_segment(1, centroids)
-    assert segment2 == "At Risk"
+    centroids = db_session.query(ClusterCentroid).order_by(ClusterCentroid.cluster_id).all()
+    assert [c.cluster_id for c in centroids] == [0, 1, 2, 3]
+    for centroid in centroids:
+        rows = sample_rfm_features[centroid.cluster_id * 5:(centroid.cluster_id + 1) * 5]
+        assert centroid.segment_name == f"Segment {centroid.cluster_id}"
+        assert centroid.customer_count == 5
+        assert centroid.recency_days == pytest.approx(np.mean([r["recency_days"] for r in rows]))
+        assert centroid.frequency == pytest.approx(np.mean([r["frequency"] for r in rows]))
+        assert centroid.monetary == pytest.approx(np.mean([float(r["monetary"]) for r in rows]))
 
+
+@pytest.mark.parametrize("cluster_id,expected", [
+    (0, "Champions"),
+    (1, "At Risk"),
+    (2, "Potential Loyalists"),
+])
+def test_map_cluster_to_segment(cluster_id, expected):
+    """Test cluster to segment name mapping."""
+    assert map_cluster_to_segment(cluster_id, _CENTROIDS_FIXTURE) == expected
+
+
+def test_standardize_inplace():
+    """Test in-place standardization and recovery of original values."""
+    X = np.array([
+        [10.0, 1.0, 5.0],
+        [20.0, 3.0, 5.0],
+        [30.0, 5.0, 5.0],
+    ])
+    original = X.copy()
+    
+    mu, sd = standardize_inplace(X)
+    
+    np.testing.assert_allclose(X.mean(axis=0), 0.0, atol=1e-12)
+    np.testing.assert_allclose(X.std(axis=0)[:2], 1.0)
+    # Constant feature is only centred
+    np.testing.assert_allclose(X[:, 2], 0.0)
+    np.testing.assert_allclose(X * sd + mu, original)
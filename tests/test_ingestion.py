@@ -0,0 +1,137 @@
+"""Tests for CSV ingestion."""
+import pytest
+import warnings
+import pandas as pd
+from contextlib import contextmanager
+from datetime import datetime
+from decimal import Decimal
+from app import ingestion
+from app.models import Customer, Order
+from app.ingestion import ingest_customers_from_csv, ingest_orders_from_csv
+
+
+def write_csv(path, text):
+    """Write a CSV fixture file (header plus rows) and return its path."""
+    path.write_text(text.strip() + "\n")
+    return str(path)
+
+
+def customers_by_id(db):
+    """Return all stored customers as {customer_id: (email, country, created_at)}."""
+    return {
+        c.customer_id: (c.email, c.country, c.created_at)
+        for c in db.query(Customer).all()
+    }
+
+
+def orders_by_id(db):
+    """Return all stored orders as {order_id: (customer_id, order_date, order_amount, currency, status)}."""
+    return {
+        o.order_id: (o.customer_id, o.order_date, o.order_amount, o.currency, o.status)
+        for o in db.query(Order).all()
+    }
+
+
+@contextmanager
+def no_setting_with_copy_warning():
+    """Fail on pandas' SettingWithCopyWarning (raised when a filtered view is assigned to)."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", pd.errors.SettingWithCopyWarning)
+        yield
+
+
+@pytest.fixture(params=["on_conflict", "fallback"])
+def upsert_path(request, monkeypatch):
+    """Run each test with ON CONFLICT upserts and with the fallback for databases without them."""
+    if request.param == "fallback":
+        monkeypatch.setattr(ingestion, "_insert_for", lambda db: None)
+        # Small lookup batches so the fallback splits its IN (...) queries
+        monkeypatch.setattr(ingestion, "FALLBACK_KEY_BATCH_SIZE", 2)
+    return request.param
+
+
+@pytest.fixture
+def customers(db_session, tmp_path, upsert_path):
+    """Ingest an initial customers CSV; returns the number of new customers."""
+    path = write_csv(tmp_path / "customers.csv", """
+customer_id,email,country,created_at
+C001,a@test.com,NL,2024-01-05
+C002,b@test.com,BE,
+C002,b2@test.com,BE,2024-02-01
+C003, c@test.com ,DE,05/03/2024
+,blank@test.com,NL,
+   ,spaces@test.com,NL,
+""")
+    with no_setting_with_copy_warning():
+        return ingest_customers_from_csv(db_session, path)
+
+
+def test_ingest_customers(db_session, customers):
+    """Test the first customer ingest: dedupe (last row wins), stripping, date parsing, blank IDs skipped."""
+    assert customers == 3
+    assert customers_by_id(db_session) == {
+        "C001": ("a@test.com", "NL", datetime(2024, 1, 5)),
+        "C002": ("b2@test.com", "BE", datetime(2024, 2, 1)),
+        # Non-ISO dates are parsed day-first
+        "C003": ("c@test.com", "DE", datetime(2024, 3, 5)),
+    }
+
+
+def test_ingest_customers_again(db_session, customers, tmp_path):
+    """Test re-ingesting customers: upsert by customer_id, missing email/country keep the stored value."""
+    path = write_csv(tmp_path / "customers_update.csv", """
+customer_id,email,country,created_at
+C001,,FR,2024-01-06
+C002,new@test.com,,2024-02-01
+C004,d@test.com,,
+""")
+    
+    assert ingest_customers_from_csv(db_session, path) == 1
+    assert db_session.query(Customer).count() == 4
+    assert customers_by_id(db_session) == {
+        "C001": ("a@test.com", "FR", datetime(2024, 1, 6)),
+        "C002": ("new@test.com", "BE", datetime(2024, 2, 1)),
+        "C003": ("c@test.com", "DE", datetime(2024, 3, 5)),
+        "C004": ("d@test.com", None, None),
+    }
+
+
+def test_ingest_orders(db_session, customers, tmp_path):
+    """Test ingesting orders twice: upsert by order_id, last row wins, defaults, day-first dates, blank IDs skipped."""
+    path = write_csv(tmp_path / "orders.csv", """
+order_id,customer_id,order_date,order_amount,currency,status
+O001,C001,2024-01-10,100.50,EUR,completed
+O002,C001,2024-01-11 14:30:00,20.00,,
+O003,C002,13/02/2024,35.25,USD,cancelled
+O003,C002,14/02/2024,40.00,USD,completed
+,C001,2024-01-12,5.00,EUR,completed
+""")
+    with no_setting_with_copy_warning():
+        assert ingest_orders_from_csv(db_session, path) == 3
+    assert orders_by_id(db_session) == {
+        "O001": ("C001", datetime(2024, 1, 10), Decimal("100.50"), "EUR", "completed"),
+        "O002": ("C001", datetime(2024, 1, 11, 14, 30), Decimal("20.00"), "EUR", "completed"),
+        "O003": ("C002", datetime(2024, 2, 14), Decimal("40.00"), "USD", "completed"),
+    }
+    
+    path = write_csv(tmp_path / "orders_update.csv", """
+order_id,customer_id,order_date,order_amount,currency,status
+O001,C001,2024-01-10,90.00,EUR,refunded
+O004,C003,01/03/2024,15.00,EUR,completed
+""")
+    assert ingest_orders_from_csv(db_session, path) == 1
+    assert db_session.query(Order).count() == 4
+    orders = orders_by_id(db_session)
+    assert orders["O001"] == ("C001", datetime(2024, 1, 10), Decimal("90.00"), "EUR", "refunded")
+    assert orders["O004"] == ("C003", datetime(2024, 3, 1), Decimal("15.00"), "EUR", "completed")
+
+
+def test_ingest_orders_invalid_date(db_session, customers, tmp_path):
+    """Test that an unparseable order_date raises and names the order."""
+    path = write_csv(tmp_path / "orders.csv", """
+order_id,customer_id,order_date,order_amount
+O001,C001,2024-01-10,100.50
+O002,C001,not a date,20.00
+""")
+    with pytest.raises(ValueError, match="Invalid order_date for order O002"):
+        ingest_orders_from_csv(db_session, path)